@@ -1,25 +1,34 @@
 # import re
 # from ipaddress import ip_address
 # from typing import Callable
+import asyncio
+import contextlib
+import logging
+import os
 from pathlib import Path
 
-import redis.asyncio as redis
+import anyio.to_thread
 from fastapi import FastAPI, Depends, HTTPException, Request, status
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, ORJSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from arq import create_pool
 from fastapi_limiter import FastAPILimiter
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, sessionmanager, init_redis, close_redis
+from src.repository.users import flush_pending_tokens
 from src.routes import contacts, auth, users
-from src.conf.config import config
+from src.services.email import arq_redis_settings
 
 # from loguru import logger
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+TOKEN_FLUSH_INTERVAL = 1
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 origins = ["*"]
 
@@ -29,6 +38,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets cross-origin clients read the contacts list cursor
+    expose_headers=["X-Next-Cursor"],
 )
 
 BASE_DIR = Path(__file__).parent
@@ -40,15 +51,40 @@ app.include_router(users.router, prefix="/api")
 app.include_router(contacts.router, prefix="/api")
 
 
+async def flush_tokens_periodically():
+    """Writes the refresh tokens queued by update_token to the database every TOKEN_FLUSH_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(TOKEN_FLUSH_INTERVAL)
+        try:
+            async with sessionmanager.session() as db:
+                await flush_pending_tokens(db)
+        except Exception:
+            # The queue is kept in Redis, so the next iteration retries it
+            logger.exception("Failed to flush pending refresh tokens")
+
+
 @app.on_event("startup")
 async def startup():
-    r = await redis.Redis(
-        host=config.REDIS_DOMAIN,
-        port=config.REDIS_PORT,
-        db=0,
-        password=config.REDIS_PASSWORD,
-    )
-    await FastAPILimiter.init(r)
+    # Each worker opens its own Redis pool, shared by the user cache, the repositories and the rate limiter
+    redis_client = init_redis()
+    await FastAPILimiter.init(redis_client)
+    app.state.arq = await create_pool(arq_redis_settings)
+    # Password hashing runs in worker threads; keep the pool close to the number of cores
+    anyio.to_thread.current_default_thread_limiter().total_tokens = min((os.cpu_count() or 1) * 2, 32)
+    app.state.token_flusher = asyncio.create_task(flush_tokens_periodically())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.token_flusher.cancel()
+    # Let the cancelled flusher release the flush lock, otherwise the final flush below would skip
+    with contextlib.suppress(asyncio.CancelledError):
+        await app.state.token_flusher
+    async with sessionmanager.session() as db:
+        await flush_pending_tokens(db)
+    await app.state.arq.aclose()
+    await close_redis()
+    await sessionmanager.close()
 
 
 templates = Jinja2Templates(directory=str(BASE_DIR / "src" / "templates"))
@@ -75,3 +111,4 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error connecting to the database")
 
 # uvicorn main:app --host localhost --port 8000 --reload
+# arq src.services.email.WorkerSettings
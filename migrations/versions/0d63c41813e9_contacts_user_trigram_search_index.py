@@ -0,0 +1,39 @@
+"""contacts_user_trigram_search_index
+
+Revision ID: 0d63c41813e9
+Revises: c3f6d11b1cc9
+Create Date: 2026-10-15 14:14:40.672766
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0d63c41813e9'
+down_revision: Union[str, None] = 'c3f6d11b1cc9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # get_contacts now matches one concatenated expression per user instead of three ILIKEs
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+    op.drop_index('ix_contacts_em_trgm', table_name='contacts', postgresql_using='gin')
+    op.drop_index('ix_contacts_ln_trgm', table_name='contacts', postgresql_using='gin')
+    op.drop_index('ix_contacts_fn_trgm', table_name='contacts', postgresql_using='gin')
+    op.execute("CREATE INDEX ix_contacts_user_trgm ON contacts USING gin "
+               "(user_id, (first_name || ' ' || last_name || ' ' || email) gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_trgm', table_name='contacts', postgresql_using='gin')
+    op.create_index('ix_contacts_fn_trgm', 'contacts', ['first_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'first_name': 'gin_trgm_ops'})
+    op.create_index('ix_contacts_ln_trgm', 'contacts', ['last_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'last_name': 'gin_trgm_ops'})
+    op.create_index('ix_contacts_em_trgm', 'contacts', ['email'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
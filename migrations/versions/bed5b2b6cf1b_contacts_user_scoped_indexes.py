@@ -0,0 +1,33 @@
+"""contacts_user_scoped_indexes
+
+Revision ID: bed5b2b6cf1b
+Revises: dc480d55490c
+Create Date: 2026-10-15 13:57:52.568627
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bed5b2b6cf1b'
+down_revision: Union[str, None] = 'dc480d55490c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # contact emails are unique per owner, not across all users
+    op.drop_index('ix_contacts_email', table_name='contacts')
+    op.create_unique_constraint('uq_contacts_user_id_email', 'contacts', ['user_id', 'email'])
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_last_name', 'contacts', ['user_id', 'last_name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_last_name', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
+    op.drop_constraint('uq_contacts_user_id_email', 'contacts', type_='unique')
+    op.create_index('ix_contacts_email', 'contacts', ['email'], unique=True)
@@ -0,0 +1,36 @@
+"""contacts_birthday_md_column
+
+Revision ID: c3f6d11b1cc9
+Revises: f92bcd495d6d
+Create Date: 2026-10-15 14:13:43.526154
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f6d11b1cc9'
+down_revision: Union[str, None] = 'f92bcd495d6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # replace the expression index with a stored generated column indexed together with user_id
+    op.drop_index('ix_contacts_birthday_md', table_name='contacts')
+    op.add_column('contacts', sa.Column(
+        'birthday_md', sa.Integer(),
+        sa.Computed('EXTRACT(month FROM birthday) * 100 + EXTRACT(day FROM birthday)', persisted=True),
+        nullable=False))
+    op.create_index('ix_contacts_birthday_md', 'contacts', ['user_id', 'birthday_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_birthday_md', table_name='contacts')
+    op.drop_column('contacts', 'birthday_md')
+    op.create_index('ix_contacts_birthday_md', 'contacts',
+                    ['user_id', sa.text('(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday))')],
+                    unique=False)
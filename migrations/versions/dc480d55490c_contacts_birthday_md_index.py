@@ -0,0 +1,29 @@
+"""contacts_birthday_md_index
+
+Revision ID: dc480d55490c
+Revises: 373bda2ab2a0
+Create Date: 2026-10-15 13:53:54.407745
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'dc480d55490c'
+down_revision: Union[str, None] = '373bda2ab2a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # month * 100 + day of the birthday, the expression get_upcoming_birthdays filters on
+    op.create_index('ix_contacts_birthday_md', 'contacts',
+                    ['user_id', sa.text('(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday))')],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_birthday_md', table_name='contacts')
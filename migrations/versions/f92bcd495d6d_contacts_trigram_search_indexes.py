@@ -0,0 +1,35 @@
+"""contacts_trigram_search_indexes
+
+Revision ID: f92bcd495d6d
+Revises: bed5b2b6cf1b
+Create Date: 2026-10-15 14:03:18.960225
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f92bcd495d6d'
+down_revision: Union[str, None] = 'bed5b2b6cf1b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # trigram indexes let the planner serve get_contacts' ILIKE '%q%' search
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_contacts_fn_trgm', 'contacts', ['first_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'first_name': 'gin_trgm_ops'})
+    op.create_index('ix_contacts_ln_trgm', 'contacts', ['last_name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'last_name': 'gin_trgm_ops'})
+    op.create_index('ix_contacts_em_trgm', 'contacts', ['email'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_em_trgm', table_name='contacts', postgresql_using='gin')
+    op.drop_index('ix_contacts_ln_trgm', table_name='contacts', postgresql_using='gin')
+    op.drop_index('ix_contacts_fn_trgm', table_name='contacts', postgresql_using='gin')
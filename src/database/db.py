@@ -1,7 +1,8 @@
 """
 Database module for managing database connections and sessions.
 
-This module provides functions and classes for creating and managing database sessions asynchronously.
+This module provides functions and classes for creating and managing database sessions asynchronously,
+and the Redis client used to cache user records.
 
 Attributes:
     engine (AsyncEngine): The asynchronous engine for the database connection.
@@ -9,13 +10,23 @@ Attributes:
 
 Classes:
     DatabaseSessionManager: A class for managing database sessions.
+
+Functions:
+    init_redis: Creates the Redis client of the current worker.
+    get_redis: Returns the Redis client of the current worker.
+    close_redis: Closes the Redis client of the current worker.
 """
 import contextlib
+import hashlib
+import logging
 
+import redis.asyncio as redis
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
-from src.conf.config import config
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from src.conf.config import get_config
 
-engine = create_async_engine(config.DB_URL)
+logger = logging.getLogger(__name__)
 
 
 class DatabaseSessionManager:
@@ -26,10 +37,10 @@ class DatabaseSessionManager:
         _engine (AsyncEngine | None): The asynchronous engine for the database connection.
         _session_maker (async_sessionmaker): The async session maker for creating database sessions.
     """
-    def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
+    def __init__(self, engine: AsyncEngine):
+        self._engine: AsyncEngine | None = engine
         self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False,
-                                                                     bind=self._engine)
+                                                                     expire_on_commit=False, bind=self._engine)
 
     @contextlib.asynccontextmanager
     async def session(self):
@@ -48,14 +59,85 @@ class DatabaseSessionManager:
         session = self._session_maker()
         try:
             yield session
-        except Exception as err:
-            print(err)
+        except SQLAlchemyError:
+            logger.exception("Database error, rolling back the session")
+            await session.rollback()
+            raise
+        except Exception:
             await session.rollback()
+            raise
         finally:
             await session.close()
 
+    async def close(self):
+        """
+        Disposes of the engine and closes all pooled connections.
+
+        Raises:
+            Exception: If the engine is not initialized.
+        """
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+        await self._engine.dispose()
+        self._engine = None
+        self._session_maker = None
+
+
+config = get_config()
+engine = create_async_engine(config.DB_URL,
+                             poolclass=AsyncAdaptedQueuePool,
+                             pool_size=config.DB_POOL_SIZE,
+                             max_overflow=config.DB_MAX_OVERFLOW,
+                             pool_pre_ping=True,
+                             pool_recycle=config.DB_POOL_RECYCLE)
+sessionmanager = DatabaseSessionManager(engine)
+_redis_client: redis.Redis | None = None
+
+
+def init_redis() -> redis.Redis:
+    """
+    Creates the Redis client of the current worker.
+
+    Called from the application startup hook, so each worker process owns its connection pool
+    instead of sharing one created at import time.
+
+    Returns:
+        Redis: The asyncio Redis client.
+    """
+    global _redis_client
+    # A full pool makes callers wait for a free connection instead of raising "Too many connections"
+    _redis_client = redis.Redis(connection_pool=redis.BlockingConnectionPool(
+        host=config.REDIS_DOMAIN,
+        port=config.REDIS_PORT,
+        db=0,
+        password=config.REDIS_PASSWORD,
+        max_connections=config.REDIS_MAX_CONNECTIONS,
+        timeout=config.REDIS_POOL_TIMEOUT,
+    ))
+    return _redis_client
+
+
+def get_redis() -> redis.Redis:
+    """
+    Returns the Redis client of the current worker.
+
+    Returns:
+        Redis: The asyncio Redis client.
+
+    Raises:
+        Exception: If init_redis has not been called.
+    """
+    if _redis_client is None:
+        raise Exception("Redis is not initialized")
+    return _redis_client
 
-sessionmanager = DatabaseSessionManager(config.DB_URL)
+
+async def close_redis() -> None:
+    """Closes the Redis client of the current worker and its connection pool."""
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.aclose()
+        _redis_client = None
 
 
 async def get_db():
@@ -67,3 +149,24 @@ async def get_db():
     """
     async with sessionmanager.session() as session:
         yield session
+
+
+# Seconds a user stays cached after being loaded or updated
+USER_CACHE_TTL = 900
+
+
+def user_cache_key(email: str) -> str:
+    """
+    Builds the Redis key under which a user is cached.
+
+    The key is a 64-bit BLAKE2b digest of the email rather than the email itself, so every cache
+    command sends 18 bytes instead of up to 254. A colliding entry would belong to another user,
+    so readers must check the email of the cached user.
+
+    Args:
+        email (str): The email address of the user.
+
+    Returns:
+        str: The cache key.
+    """
+    return "u:" + hashlib.blake2b(email.encode(), digest_size=8).hexdigest()
@@ -9,7 +9,9 @@ Classes:
 """
 from datetime import date
 
-from sqlalchemy import Integer, String, Date, ForeignKey, DateTime, func, Boolean
+from sqlalchemy import (Integer, String, Date, ForeignKey, DateTime, func, Boolean, Index, UniqueConstraint,
+                        Computed, extract, literal_column)
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -25,28 +27,57 @@ class Contact(Base):
         id (int): The unique identifier for the contact.
         first_name (str): The first name of the contact.
         last_name (str): The last name of the contact.
-        email (str): The email address of the contact (unique).
+        email (str): The email address of the contact (unique per user).
         phone_number (str): The phone number of the contact.
-        birthday (Date): The birthday of the contact.
+        birthday (date): The birthday of the contact.
+        birthday_md (int): Month * 100 + day of the birthday, generated by the database.
         additional_data (str): Additional data related to the contact (nullable).
         created_at (date):  Created at the contact
         updated_at (date): Updated at the contact
         user_id (int): The foreign key referencing the user who owns this contact.
         user (relationship): Relationship to the User model.
+        search_text (str): First name, last name and email joined by spaces.
     """
     __tablename__ = "contacts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "email", name="uq_contacts_user_id_email"),
+        Index("ix_contacts_user_id_id", "user_id", "id"),
+        Index("ix_contacts_user_id_last_name", "user_id", "last_name"),
+        Index("ix_contacts_birthday_md", "user_id", "birthday_md"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     first_name: Mapped[str] = mapped_column(String)
     last_name: Mapped[str] = mapped_column(String)
-    email: Mapped[str] = mapped_column(String, unique=True, index=True)
+    email: Mapped[str] = mapped_column(String)
     phone_number: Mapped[str] = mapped_column(String)
-    birthday: Mapped[Date] = mapped_column(Date)
+    birthday: Mapped[date] = mapped_column(Date)
+    # Lets get_upcoming_birthdays range-scan ix_contacts_birthday_md regardless of the birth year
+    birthday_md: Mapped[int] = mapped_column(Integer, Computed(
+        extract("month", literal_column("birthday")) * 100 + extract("day", literal_column("birthday")),
+        persisted=True))
     additional_data: Mapped[str] = mapped_column(String, nullable=True)
     created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now(), nullable=True)
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now(),
                                              nullable=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id'), nullable=True)
-    user: Mapped["User"] = relationship("User", backref="contacts", lazy="joined")
+    user: Mapped["User"] = relationship("User", back_populates="contacts", lazy="raise_on_sql")
+
+    @hybrid_property
+    def search_text(self) -> str:
+        """First name, last name and email joined by spaces, the text matched by the contacts search."""
+        return self.first_name + " " + self.last_name + " " + self.email
+
+    @search_text.inplace.expression
+    @classmethod
+    def _search_text_expression(cls):
+        # Separators are rendered inline, not bound, so queries match the index expression exactly
+        separator = literal_column("' '", String)
+        return cls.first_name + separator + cls.last_name + separator + cls.email
+
+
+# Trigram index (pg_trgm, btree_gin for user_id) for the per-user ILIKE '%q%' search in get_contacts
+Index("ix_contacts_user_trgm", Contact.user_id, Contact.search_text.label("search_text"),
+      postgresql_using="gin", postgresql_ops={"search_text": "gin_trgm_ops"})
 
 
 class User(Base):
@@ -64,6 +95,7 @@ class User(Base):
         created_at (date):  Created timestamp of the user
         updated_at (date): Updated timestamp of the user
         confirmed (bool): Whether the user's email address is confirmed.
+        contacts (relationship): Relationship to the user's Contact models.
     """
     __tablename__ = 'users'
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
@@ -75,3 +107,4 @@ class User(Base):
     created_at: Mapped[date] = mapped_column('created_at', DateTime, default=func.now())
     updated_at: Mapped[date] = mapped_column('updated_at', DateTime, default=func.now(), onupdate=func.now())
     confirmed: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
+    contacts: Mapped[list["Contact"]] = relationship("Contact", back_populates="user", lazy="raise_on_sql")
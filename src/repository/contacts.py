@@ -1,55 +1,51 @@
-from typing import Optional, List
+from typing import Optional
 
-# from logger import logger
-from datetime import datetime  # timedelta
+from datetime import date, timedelta
 
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, delete, or_, lambda_stmt
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from src.entity.models import Contact, User
-from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse
+from src.schemas.contact import ContactSchema, ContactUpdateSchema, CONTACT_LIST_ADAPTER
 
+# Contacts are returned with their owner embedded as UserResponse, so only those columns are loaded
+_load_user = selectinload(Contact.user).load_only(User.id, User.username, User.email, User.avatar)
 
-async def get_contacts(limit: int, offset: int, user: User, db: AsyncSession, search: Optional[str] = None):
+
+async def get_contacts(limit: int, cursor: Optional[int], user: User, db: AsyncSession,
+                       search: Optional[str] = None):
     """
-    Retrieves a list of contacts for a specific user with specified pagination parameters.
+    Retrieves a page of contacts for a specific user, ordered by ID.
+
+    Pagination is keyset based: the next page starts after the last contact ID of the previous one.
 
     :param limit: The maximum number of contacts to return.
     :type limit: int
-    :param offset: The number of contacts to skip.
-    :type offset: int
+    :param cursor: The ID of the last contact of the previous page, or None for the first page.
+    :type cursor: Optional[int]
     :param user: The user to retrieve contacts for.
     :type user: User
     :param db: The database session.
     :type db: AsyncSession
-    :param search: Optional search string to filter contacts by first name, last name, or email.
+    :param search: Optional search string matched against the contact's first name, last name and email.
     :type search: Optional[str]
     :return: A list of contacts.
     :rtype: List[Contact]
     """
-    stmt = select(Contact).filter(Contact.user_id == user.id).offset(offset).limit(limit)
+    # lambda_stmt caches the built statement per combination of optional filters;
+    # only the closure values are re-bound on each call
+    user_id = user.id
+    stmt = lambda_stmt(lambda: select(Contact).options(_load_user).filter(Contact.user_id == user_id))
+    if cursor is not None:
+        stmt += lambda s: s.filter(Contact.id > cursor)
     if search:
-        search = f"%{search}%"
-        stmt = stmt.filter(
-            (Contact.first_name.ilike(search))
-            | (Contact.last_name.ilike(search))
-            | (Contact.email.ilike(search))
-        )
+        pattern = f"%{search}%"
+        # Matches the ix_contacts_user_trgm expression
+        stmt += lambda s: s.filter(Contact.search_text.ilike(pattern))
+    stmt += lambda s: s.order_by(Contact.id).limit(limit)
     result = await db.execute(stmt)
-    contacts = [ContactResponse(
-        id=contact.id,
-        first_name=contact.first_name,
-        last_name=contact.last_name,
-        email=contact.email,
-        phone_number=contact.phone_number,
-        birthday=contact.birthday,
-        additional_data=contact.additional_data,
-        created_at=contact.created_at,
-        updated_at=contact.updated_at,
-        user=contact.user
-    ) for contact in result]
-
-    return contacts
+    return result.scalars().all()
 
 
 async def get_contact(contact_id: int, user: User, db: AsyncSession) -> Optional[Contact]:
@@ -65,9 +61,10 @@ async def get_contact(contact_id: int, user: User, db: AsyncSession) -> Optional
     :return: The contact if found, otherwise None.
     :rtype: Optional[Contact]
     """
-    stmt = select(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id)
-    result = await db.execute(stmt)
-    return result.scalar_one_or_none()
+    contact = await db.get(Contact, contact_id, options=[_load_user])
+    if contact is None or contact.user_id != user.id:
+        return None
+    return contact
 
 
 async def create_contact(body: ContactSchema, user: User, db: AsyncSession) -> Contact:
@@ -83,10 +80,11 @@ async def create_contact(body: ContactSchema, user: User, db: AsyncSession) -> C
     :return: The created contact.
     :rtype: Contact
     """
-    contact = Contact(**body.model_dump(), user_id=user.id)
-    db.add(contact)
+    stmt = (insert(Contact).values(**body.model_dump(), user_id=user.id)
+            .returning(Contact).options(_load_user))
+    result = await db.execute(stmt)
+    contact = result.scalar_one()
     await db.commit()
-    await db.refresh(contact)
     return contact
 
 
@@ -105,18 +103,19 @@ async def update_contact(contact_id: int, body: ContactUpdateSchema, user: User,
     :return: The updated contact if found, otherwise None.
     :rtype: Optional[Contact]
     """
-    stmt = select(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id)
+    values = body.model_dump(exclude_unset=True)
+    if not values:
+        return await get_contact(contact_id, user, db)
+    stmt = (update(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).values(**values)
+            .returning(Contact).options(_load_user))
+    # The default session sync applies the RETURNING values to a contact already loaded in the session
     result = await db.execute(stmt)
     contact = result.scalar_one_or_none()
-    if contact:
-        for field, value in body.model_dump(exclude_unset=True).items():
-            setattr(contact, field, value)
-        await db.commit()
-        await db.refresh(contact)
+    await db.commit()
     return contact
 
 
-async def delete_contact(contact_id: int, user: User, db: AsyncSession) -> Optional[Contact]:
+async def delete_contact(contact_id: int, user: User, db: AsyncSession) -> Optional[int]:
     """
     Deletes a specific contact for a user by contact ID.
 
@@ -126,16 +125,16 @@ async def delete_contact(contact_id: int, user: User, db: AsyncSession) -> Optio
     :type user: User
     :param db: The database session.
     :type db: AsyncSession
-    :return: The deleted contact if found, otherwise None.
-    :rtype: Optional[Contact]
+    :return: The ID of the deleted contact if found, otherwise None.
+    :rtype: Optional[int]
     """
-    stmt = select(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id)
-    result = await db.execute(stmt)
-    contact = result.scalar_one_or_none()
-    if contact:
-        await db.delete(contact)
-        await db.commit()
-    return contact
+    user_id = user.id
+    stmt = lambda_stmt(lambda: delete(Contact).where(Contact.id == contact_id, Contact.user_id == user_id)
+                       .returning(Contact.id))
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    deleted_id = result.scalar_one_or_none()
+    await db.commit()
+    return deleted_id
 
 
 async def get_upcoming_birthdays(user: User, db: AsyncSession):
@@ -147,43 +146,17 @@ async def get_upcoming_birthdays(user: User, db: AsyncSession):
     :param db: The database session.
     :type db: AsyncSession
     :return: A list of contacts with upcoming birthdays.
-    :rtype: List[Contact]
+    :rtype: List[ContactResponse]
     """
-
-    def days_to_birthday(birthday: str):
-        if not birthday:
-            return None
-        today = datetime.now().date()
-        birthday = datetime.strptime(birthday, "%Y-%m-%d").date()
-        next_birthday = datetime(today.year, birthday.month, birthday.day).date()
-        if today > next_birthday:
-            next_birthday = datetime(today.year + 1, birthday.month, birthday.day).date()
-        return (next_birthday - today).days
-
-    # today = datetime.now().date()
-    # end_date = today + timedelta(days=7)
-    # logger.info(f"today: {today}, end_date: {end_date}")
-    # stmt = select(Contact).filter(
-    #     func.date_part('month', Contact.birthday) == today.month,
-    #     func.date_part('day', Contact.birthday) >= today.day,
-    #     func.date_part('day', Contact.birthday) <= end_date.day
-    # )
-    stmt = select(Contact).filter(Contact.user_id == user.id)
-    contacts = await db.execute(stmt)
-    # birthdays = contacts
-    # birthdays = contacts.scalars().all()
-    upcoming_birthdays = [ContactResponse(
-        id=contact.id,
-        first_name=contact.first_name,
-        last_name=contact.last_name,
-        email=contact.email,
-        phone_number=contact.phone_number,
-        birthday=contact.birthday,
-        additional_data=contact.additional_data,
-        created_at=contact.created_at,
-        updated_at=contact.updated_at,
-        user=contact.user
-    ) for contact in contacts if days_to_birthday(str(contact.birthday)) <= 7]
-    # for contact in upcoming_birthdays:
-    #     print(days_to_birthday(str(contact.birthday)))
-    return upcoming_birthdays
+    today = date.today()
+    end_date = today + timedelta(days=7)
+    start_md = today.month * 100 + today.day
+    end_md = end_date.month * 100 + end_date.day
+    if start_md <= end_md:
+        window = Contact.birthday_md.between(start_md, end_md)
+    else:
+        # The window wraps past December 31
+        window = or_(Contact.birthday_md >= start_md, Contact.birthday_md <= end_md)
+    stmt = select(Contact).options(_load_user).filter(Contact.user_id == user.id, window)
+    contacts = await db.stream_scalars(stmt.execution_options(yield_per=512))
+    return CONTACT_LIST_ADAPTER.validate_python([contact async for contact in contacts])
@@ -4,21 +4,55 @@ Repository module for user operations.
 This module contains functions for interacting with the user database table.
 
 Functions:
+    gravatar_url: Builds the Gravatar avatar URL for an email address.
     get_user_by_email: Retrieves a user by email address.
     create_user: Creates a new user.
-    update_token: Updates the refresh token for a user.
+    update_token: Queues the refresh token of a user for writing.
+    get_refresh_token: Returns the current refresh token of a user.
+    flush_pending_tokens: Writes the queued refresh tokens to the database.
+    update_password: Updates the password hash for a user.
     confirmed_email: Confirms the email address for a user.
     update_avatar_url: Updates the avatar URL for a user.
 """
 
+import contextlib
+import hashlib
+from functools import lru_cache
 from typing import Optional
-from libgravatar import Gravatar
+
+from redis.exceptions import LockNotOwnedError
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from src.database.db import get_redis, user_cache_key
 from src.entity.models import User
 from src.schemas.user import UserSchema
 
+# Refresh tokens are written behind: update_token queues them in this Redis hash (user id -> token,
+# "" for a revoked token) and flush_pending_tokens moves them to Postgres in one batched UPDATE
+PENDING_TOKENS_KEY = "pending_tokens"
+FLUSHING_TOKENS_KEY = "pending_tokens:flushing"
+FLUSH_LOCK_KEY = "pending_tokens:lock"
+# Well above the database connect and pool checkout timeouts, so the lock outlives a slow flush
+FLUSH_LOCK_TIMEOUT = 300
+
+
+@lru_cache(maxsize=1024)
+def gravatar_url(email: str) -> str:
+    """
+    Builds the Gravatar avatar URL for an email address.
+
+    Args:
+        email (str): The email address.
+
+    Returns:
+        str: The Gravatar image URL, falling back to an identicon.
+    """
+    email_hash = hashlib.md5(email.strip().lower().encode()).hexdigest()
+    return f"https://www.gravatar.com/avatar/{email_hash}?d=identicon"
+
 
 async def get_user_by_email(email: str, db: AsyncSession) -> Optional[User]:
     """
@@ -35,59 +69,136 @@ async def get_user_by_email(email: str, db: AsyncSession) -> Optional[User]:
     return result.scalars().first()
 
 
-async def create_user(body: UserSchema, db: AsyncSession) -> User:
+async def create_user(body: UserSchema, db: AsyncSession) -> Optional[User]:
     """
-    Creates a new user.
+    Creates a new user unless the email or username is already taken.
 
     Args:
         body (UserModel): The user data to create.
         db (Session): The database session.
 
     Returns:
-        User: The created user object.
+        User | None: The created user object, or None if a user with the same email or username exists.
     """
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as e:
-        print(e)
-    new_user = User(**body.dict(), avatar=avatar)
-    db.add(new_user)
+    avatar = gravatar_url(body.email)
+    # The unique constraints reject duplicates, so no lookup is needed beforehand
+    stmt = insert(User).values(**body.model_dump(), avatar=avatar).on_conflict_do_nothing().returning(User)
+    result = await db.execute(stmt)
+    new_user = result.scalar_one_or_none()
     await db.commit()
-    await db.refresh(new_user)
     return new_user
 
 
 async def update_token(user: User, token: Optional[str],  db: AsyncSession) -> None:
     """
-    Updates the refresh token for a user.
+    Queues the refresh token of a user to be written by flush_pending_tokens.
 
     Args:
         user (User): The user object to update.
-        token (str): The new refresh token.
+        token (str | None): The new refresh token, or None to revoke it.
         db (Session): The database session.
     """
+    await get_redis().hset(PENDING_TOKENS_KEY, user.id, token or "")
     user.refresh_token = token
+
+
+async def get_refresh_token(user: User, db: AsyncSession) -> Optional[str]:
+    """
+    Returns the current refresh token of a user, preferring a token that is not flushed yet.
+
+    Args:
+        user (User): The user loaded from the database.
+        db (AsyncSession): The database session.
+
+    Returns:
+        str | None: The refresh token, or None if it was revoked or never issued.
+    """
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hget(PENDING_TOKENS_KEY, user.id)
+    pipe.hget(FLUSHING_TOKENS_KEY, user.id)
+    for pending in await pipe.execute():
+        if pending is not None:
+            return pending.decode() or None
+    # A flush may have committed the token after the user was loaded, so the column is read again
+    return await db.scalar(select(User.refresh_token).where(User.id == user.id))
+
+
+async def flush_pending_tokens(db: AsyncSession) -> int:
+    """
+    Writes the queued refresh tokens to the database in a single batched UPDATE.
+
+    The queue is renamed before it is read, so tokens queued meanwhile wait for the next flush,
+    and it stays readable by get_refresh_token until the UPDATE is committed.
+
+    Args:
+        db (AsyncSession): The asynchronous database session.
+
+    Returns:
+        int: The number of users whose refresh token was written.
+    """
+    redis_client = get_redis()
+    lock = redis_client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT)
+    if not await lock.acquire(blocking=False):
+        # Another worker is flushing
+        return 0
+    try:
+        # A leftover batch from a failed flush is retried before new tokens are taken
+        if not await redis_client.exists(FLUSHING_TOKENS_KEY):
+            if not await redis_client.exists(PENDING_TOKENS_KEY):
+                return 0
+            await redis_client.rename(PENDING_TOKENS_KEY, FLUSHING_TOKENS_KEY)
+        pending = await redis_client.hgetall(FLUSHING_TOKENS_KEY)
+        if pending:
+            # Restart the lock timeout before the UPDATE, the slowest step
+            await lock.reacquire()
+            # ORM bulk UPDATE by primary key, executed as one executemany
+            await db.execute(update(User), [{"id": int(user_id), "refresh_token": token.decode() or None}
+                                            for user_id, token in pending.items()])
+            # If the lock expired meanwhile, another worker owns the queue and may have written newer tokens
+            if not await lock.owned():
+                await db.rollback()
+                return 0
+            await db.commit()
+        if not await lock.owned():
+            return len(pending)
+        await redis_client.delete(FLUSHING_TOKENS_KEY)
+        return len(pending)
+    finally:
+        # A lock lost to expiry must not hide the outcome of the flush
+        with contextlib.suppress(LockNotOwnedError):
+            await lock.release()
+
+
+async def update_password(user: User, password: str, db: AsyncSession) -> None:
+    """
+    Updates the password hash for a user and evicts the user from the cache.
+
+    Args:
+        user (User): The user object to update.
+        password (str): The new password hash.
+        db (Session): The database session.
+    """
+    user.password = password
     await db.commit()
+    await get_redis().delete(user_cache_key(user.email))
 
 
 async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
-    Confirms the email address for a user.
+    Confirms the email address for a user and evicts the user from the cache.
 
     Args:
         email (str): The email address to confirm.
         db (AsyncSession): The asynchronous database session.
     """
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
+    await db.execute(update(User).where(User.email == email).values(confirmed=True))
     await db.commit()
+    await get_redis().delete(user_cache_key(email))
 
 
 async def update_avatar_url(email: str, url: str | None, db: AsyncSession) -> User:
     """
-    Updates the avatar URL for a user.
+    Updates the avatar URL for a user and evicts the user from the cache.
 
     Args:
         email (str): The email address of the user.
@@ -97,8 +208,9 @@ async def update_avatar_url(email: str, url: str | None, db: AsyncSession) -> Us
     Returns:
         User: The updated user object.
     """
-    user = await get_user_by_email(email, db)
-    user.avatar = url
+    stmt = update(User).where(User.email == email).values(avatar=url).returning(User)
+    result = await db.execute(stmt)
+    user = result.scalar_one()
     await db.commit()
-    await db.refresh(user)
+    await get_redis().delete(user_cache_key(email))
     return user
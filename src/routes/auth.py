@@ -11,9 +11,12 @@ Routes:
     - /auth/confirmed_email/{token}: Endpoint for confirming email addresses.
     - /auth/request_email: Endpoint for requesting email confirmation.
 """
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request, Response
+import logging
+
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from fastapi.responses import FileResponse
+from fastapi.responses import RedirectResponse
+from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.conf import messages
@@ -21,33 +24,33 @@ from src.database.db import get_db
 from src.schemas.user import UserSchema, UserResponse, TokenSchema, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.services.email import send_email
 
+logger = logging.getLogger(__name__)
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
+async def signup(body: UserSchema, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Endpoint for user registration.
 
+    The confirmation email is queued for the arq email worker.
+
     Args:
         body (UserSchema): The user data to register.
-        bt (BackgroundTasks): Background task to send email confirmation.
         request (Request): The request object.
         db (Session): The database session.
 
     Returns:
         dict: A dictionary containing user details and registration confirmation message.
     """
-    exist_user = await repository_users.get_user_by_email(body.email, db)
-    if exist_user:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.ACCOUNT_EXIST)
-
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
-    bt.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
+    if new_user is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.ACCOUNT_EXIST)
+    await request.app.state.arq.enqueue_job("send_email_task", new_user.email, new_user.username,
+                                            str(request.base_url))
     return new_user
 
 
@@ -68,8 +71,11 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_EMAIL)
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.EMAIL_NOT_CONFIRMED)
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_user_password(user, body.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_PASSWORD)
+    if auth_service.password_needs_rehash(user.password):
+        await repository_users.update_password(user, await auth_service.get_password_hash(body.password), db)
+    await auth_service.cache_verified_password(user, body.password)
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
     await repository_users.update_token(user, refresh_token, db)
@@ -92,7 +98,7 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
     token = credentials.credentials
     email = await auth_service.decode_refresh_token(token)
     user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
+    if await repository_users.get_refresh_token(user, db) != token:
         await repository_users.update_token(user, None, db)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_REFRESH_TOKEN)
     access_token = await auth_service.create_access_token(data={"sub": email})
@@ -124,46 +130,49 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
 
 
 # Этот код представляет собой обработчик POST-запроса для запроса подтверждения email.
-@router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: AsyncSession = Depends(get_db)):
+@router.post('/request_email', dependencies=[Depends(RateLimiter(times=1, seconds=60))])
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Endpoint for requesting email confirmation.
 
+    The confirmation email is queued for the arq email worker. Unknown and already confirmed addresses
+    get the same reply as the rest, so the endpoint does not reveal which emails are registered.
+
     Args:
         body (RequestEmail): The email request data.
-        background_tasks (BackgroundTasks): Background task to send email confirmation.
         request (Request): The request object.
         db (AsyncSession): The asynchronous database session.
 
     Returns:
         dict: A dictionary containing a confirmation message.
     """
+    cached_user = await auth_service.get_cached_user(body.email)  # Подтверждённый пользователь из кэша не требует БД
+    if cached_user is not None and cached_user.confirmed:
+        return {"message": "Check your email for confirmation."}
     user = await repository_users.get_user_by_email(body.email, db)  # Получаем пользователя по email из базы данных
-
-    if user.confirmed:  # Если email уже подтвержден
-        return {"message": "Your email is already confirmed"}
-    if user:  # Если пользователь существует
-        background_tasks.add_task(send_email, user.email, user.username,
-                                  str(request.base_url))  # Добавляем задачу отправки email
+    if user is None or user.confirmed:  # Не раскрываем, существует ли пользователь и подтверждён ли он
+        return {"message": "Check your email for confirmation."}
+    await request.app.state.arq.enqueue_job("send_email_task", user.email, user.username,
+                                            str(request.base_url))  # Ставим отправку email в очередь
     return {"message": "Check your email for confirmation."}  # Возвращаем сообщение о запросе подтверждения email
 
 
 # Этот код представляет собой обработчик GET-запроса для отслеживания того, что пользователь открыл email.
 @router.get('/{username}')
-async def request_email(username: str, response: Response, db: AsyncSession = Depends(get_db)):
+async def request_email(username: str, request: Request):
     """
     Endpoint for handling email opening tracking.
 
+    Records the open and redirects to the tracking pixel served by the static files mount.
+
     Args:
         username (str): The username for tracking.
-        response (Response): The response object.
-        db (AsyncSession): The asynchronous database session.
+        request (Request): The request object.
 
     Returns:
-        FileResponse: The image file response.
+        RedirectResponse: A redirect to the tracking pixel image.
     """
-    print('--------------------------------')
-    print(f'{username} зберігаємо що він відкрив email в БД')
-    print('--------------------------------')
-    return FileResponse("src/static/open_check.png", media_type="image/png", content_disposition_type="inline")
+    logger.debug("%s opened the email", username)
+    # The redirect is cached by the client, so repeated opens do not reach the server
+    return RedirectResponse(request.url_for("static", path="open_check.png"), status_code=status.HTTP_302_FOUND,
+                            headers={"Cache-Control": "public, max-age=31536000, immutable"})
@@ -8,28 +8,33 @@ Routes:
     - /contacts/birthdays: Endpoint for retrieving upcoming birthdays.
     - /contacts/{contact_id}: Endpoints for retrieving, updating, and deleting contacts.
 """
-from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
+import logging
+
+from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.entity.models import User
 from src.repository import contacts as repositories_contacts
-from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse
+from src.schemas.contact import ContactSchema, ContactUpdateSchema, ContactResponse, CONTACT_LIST_ADAPTER
 from src.services.auth import auth_service
 
+logger = logging.getLogger(__name__)
 router = APIRouter(prefix='/contacts', tags=['contacts'])
 
 
 @router.get("/", response_model=list[ContactResponse])
-async def get_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Query(0, ge=0),
+async def get_contacts(limit: int = Query(10, ge=10, le=500), cursor: int = Query(None, ge=0),
                        search: str = None, db: AsyncSession = Depends(get_db),
                        current_user: User = Depends(auth_service.get_current_user)):
     """
     Endpoint for retrieving contacts.
 
+    When a full page is returned, the ``X-Next-Cursor`` response header holds the cursor of the next page.
+
     Args:
         limit (int): The maximum number of contacts to retrieve.
-        offset (int): The offset for pagination.
+        cursor (int): The ID of the last contact of the previous page.
         search (str): The search query for filtering contacts.
         db (AsyncSession): The asynchronous database session.
         current_user (User): The current authenticated user.
@@ -37,8 +42,11 @@ async def get_contacts(limit: int = Query(10, ge=10, le=500), offset: int = Quer
     Returns:
         List[ContactResponse]: A list of contact objects.
     """
-    contacts = await repositories_contacts.get_contacts(limit, offset, current_user, db, search)
-    return contacts
+    contacts = await repositories_contacts.get_contacts(limit, cursor, current_user, db, search)
+    headers = {"X-Next-Cursor": str(contacts[-1].id)} if len(contacts) == limit else None
+    # Validate once and encode with pydantic-core instead of FastAPI's jsonable_encoder pass
+    content = CONTACT_LIST_ADAPTER.dump_json(CONTACT_LIST_ADAPTER.validate_python(contacts))
+    return Response(content=content, media_type="application/json", headers=headers)
 
 
 @router.get("/birthdays", response_model=list[ContactResponse])
@@ -54,9 +62,10 @@ async def get_upcoming_birthdays_route(db: AsyncSession = Depends(get_db),
     Returns:
         List[ContactBirthdayResponse]: A list of contact objects with upcoming birthdays.
     """
-    print(f"Route {current_user}")
+    logger.debug("Upcoming birthdays requested by %s", current_user.email)
     birthdays = await repositories_contacts.get_upcoming_birthdays(current_user, db)
-    return birthdays
+    # Already validated by the repository, so serialize directly instead of re-validating
+    return Response(content=CONTACT_LIST_ADAPTER.dump_json(birthdays), media_type="application/json")
 
 
 @router.get("/{contact_id}", response_model=ContactResponse)
@@ -129,7 +138,6 @@ async def delete_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depend
         db (AsyncSession): The asynchronous database session.
         current_user (User): The current authenticated user.
     """
-    contact = await repositories_contacts.delete_contact(contact_id, current_user, db)
-    if contact is None:
+    deleted_id = await repositories_contacts.delete_contact(contact_id, current_user, db)
+    if deleted_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="NOT FOUND")
-    return contact
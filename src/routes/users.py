@@ -8,8 +8,10 @@ Routes:
     - /users/avatar: Endpoint for updating the user's avatar.
 """
 
-import pickle
+import logging
+from functools import partial
 
+import anyio.to_thread
 import cloudinary
 import cloudinary.uploader
 from fastapi import (
@@ -25,10 +27,14 @@ from src.database.db import get_db
 from src.entity.models import User
 from src.schemas.user import UserResponse
 from src.services.auth import auth_service
-from src.conf.config import config
+from src.conf.config import get_config
 from src.repository import users as repositories_users
 
+logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/users", tags=["users"])
+config = get_config()
+# Slow uploads wait on their own threads and never hold the default limiter sized for password hashing
+_upload_limiter = anyio.CapacityLimiter(10)
 
 cloudinary.config(
     cloud_name=config.CLD_NAME,
@@ -85,14 +91,16 @@ async def get_current_user(
         UserResponse: The updated user details with the new avatar.
     """
     public_id = f"Web21/{user.email}"
-    res = cloudinary.uploader.upload(file.file, public_id=public_id, owerite=True)
-    print(res)
+    # The upload is a blocking HTTP request, so it runs in a worker thread
+    res = await anyio.to_thread.run_sync(
+        partial(cloudinary.uploader.upload, file.file, public_id=public_id, owerite=True),
+        limiter=_upload_limiter)
+    logger.debug("Cloudinary upload result: %s", res)
     res_url = cloudinary.CloudinaryImage(public_id).build_url(
         width=250, height=250, crop="fill", version=res.get("version")
     )
     user = await repositories_users.update_avatar_url(user.email, res_url, db)
-    auth_service.cache.set(user.email, pickle.dumps(user))
-    auth_service.cache.expire(user.email, 300)
+    await auth_service.cache_user(user)
 
     # return UserResponse(
     #     id=updated_user.id,
@@ -8,12 +8,15 @@ Models:
     - ContactUpdateSchema: Schema for updating a contact.
     - ContactResponse: Schema for representing a contact response.
 
+Attributes:
+    - CONTACT_LIST_ADAPTER: Type adapter for validating and serializing lists of ContactResponse.
+
 """
 
 from datetime import date, datetime
 from typing import Optional
 
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, TypeAdapter
 
 from src.schemas.user import UserResponse
 
@@ -65,7 +68,12 @@ class ContactResponse(ContactSchema):
         user (UserResponse ): Relationship to the User schema
     """
     id: int
+    # Stored emails were validated on the way in; re-running email validation per row is pure overhead
+    email: str
     created_at: datetime | None
     updated_at: datetime | None
     user: UserResponse | None
     model_config = ConfigDict(from_attributes=True)
+
+
+CONTACT_LIST_ADAPTER = TypeAdapter(list[ContactResponse])
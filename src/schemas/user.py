@@ -23,7 +23,8 @@ class UserResponse(BaseModel):
     """Schema for representing a user response."""
     id: int = 1
     username: str
-    email: EmailStr
+    # Stored emails were validated on signup; a plain str skips email validation on every response
+    email: str
     avatar: str | None
     model_config = ConfigDict(from_attributes=True)
 
@@ -7,79 +7,160 @@ Classes:
     - Auth: Class providing authentication and authorization methods.
 """
 
-import pickle
-
+import hashlib
+import hmac
+import logging
+import re
+import time
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
 
-import redis
+import anyio.to_thread
+import msgpack
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+import jwt
+from jwt.exceptions import PyJWTError
 
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, Request, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
-from datetime import datetime, timedelta, timezone
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_redis, user_cache_key, USER_CACHE_TTL
 from src.entity.models import User
 from src.repository import users as repository_users
-from src.conf.config import config
+from src.conf.config import get_config
+
+config = get_config()
+logger = logging.getLogger(__name__)
+
+# PyJWT signs with hmac over hashlib.sha256; only the OpenSSL implementation uses the CPU's SHA extensions
+if hashlib.sha256.__module__ != "_hashlib":
+    logger.warning("hashlib.sha256 is not backed by OpenSSL, token signing uses the slower builtin SHA-256")
+
+# Token settings are bound once at import instead of being looked up and encoded on every token operation
+_SECRET = config.SECRET_KEY_JWT.encode()
+_ALG = config.ALGORITHM
+_ALGORITHMS = [_ALG]
+# Tokens carry no audience or issuer, so those checks are skipped
+_DECODE_OPTIONS = {"verify_aud": False, "verify_iss": False, "require": ["exp", "sub"]}
+# Token lifetimes in seconds; iat/exp are minted as integer epoch seconds, which is what JWT stores anyway
+ACCESS_TOKEN_TTL = 15 * 60
+REFRESH_TOKEN_TTL = 7 * 24 * 60 * 60
+EMAIL_TOKEN_TTL = 24 * 60 * 60
+
+_BEARER_RE = re.compile(r"Bearer (.+)", re.IGNORECASE)
+
+
+class _FastBearer(OAuth2PasswordBearer):
+    """OAuth2PasswordBearer that matches a well-formed bearer header directly, leaving the error paths to FastAPI."""
+
+    async def __call__(self, request: Request) -> Optional[str]:
+        match = _BEARER_RE.match(request.headers.get("authorization", ""))
+        if match is not None:
+            return match.group(1)
+        return await super().__call__(request)
 
 
 class Auth:
     """Class providing authentication and authorization methods."""
+    # New hashes are argon2id (OWASP profile); bcrypt is kept to verify hashes stored before the switch
+    password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    SECRET_KEY = config.SECRET_KEY_JWT
-    ALGORITHM = config.ALGORITHM
-    oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    cache = redis.Redis(
-        host=config.REDIS_DOMAIN,
-        port=config.REDIS_PORT,
-        db=0,
-        password=config.REDIS_PASSWORD,
-    )
-
-    def verify_password(self, plain_password, hashed_password):
-        """Verify a password."""
+    oauth2_scheme = _FastBearer(tokenUrl="/api/auth/login", scheme_name="OAuth2PasswordBearer")
+
+    def _verify_password(self, plain_password, hashed_password):
+        if hashed_password.startswith("$argon2"):
+            try:
+                return self.password_hasher.verify(hashed_password, plain_password)
+            except (VerificationError, InvalidHashError):
+                return False
         return self.pwd_context.verify(plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
-        """Generate a password hash."""
-        return self.pwd_context.hash(password)
+    async def verify_password(self, plain_password, hashed_password):
+        """Verify a password against an argon2 or a legacy bcrypt hash in a worker thread."""
+        return await anyio.to_thread.run_sync(self._verify_password, plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str):
+        """Generate a password hash in a worker thread."""
+        return await anyio.to_thread.run_sync(self.password_hasher.hash, password)
+
+    @staticmethod
+    def _user_to_dict(user: User) -> dict:
+        # Only the columns routes read from the current user; password and refresh_token never reach the cache
+        return {"id": user.id, "username": user.username, "email": user.email,
+                "avatar": user.avatar, "confirmed": user.confirmed}
+
+    @classmethod
+    def _dump_user(cls, user: User) -> bytes:
+        return msgpack.packb(cls._user_to_dict(user), use_bin_type=True)
+
+    @staticmethod
+    def _load_user(raw: bytes) -> User:
+        return User(**msgpack.unpackb(raw, raw=False))
+
+    async def cache_user(self, user: User) -> None:
+        """Store a user in the cache."""
+        await get_redis().setex(user_cache_key(user.email), USER_CACHE_TTL, self._dump_user(user))
+
+    async def get_cached_user(self, email: str) -> Optional[User]:
+        """Get a user from the cache, or None on a cache miss."""
+        cached = await get_redis().get(user_cache_key(email))
+        if cached is None:
+            return None
+        user = self._load_user(cached)
+        # Keys are email digests; a collision is treated as a miss instead of returning another user
+        return user if user.email == email else None
+
+    def _password_cache_key(self, email: str, password: str) -> str:
+        # Keyed with the app secret so a leaked Redis does not expose fast password hashes
+        digest = hmac.new(_SECRET, f"{email}:{password}".encode(), hashlib.sha256).hexdigest()
+        return f"pwok:{digest}"
+
+    async def verify_user_password(self, user: User, plain_password: str) -> bool:
+        """Verify a user's password, skipping the hasher for credentials verified in the last few minutes."""
+        cached = await get_redis().get(self._password_cache_key(user.email, plain_password))
+        # The entry holds the tail of the stored hash, so it stops matching once the password changes
+        if cached is not None and hmac.compare_digest(cached, user.password[-16:].encode()):
+            return True
+        return await self.verify_password(plain_password, user.password)
+
+    async def cache_verified_password(self, user: User, plain_password: str) -> None:
+        """Remember successfully verified credentials for five minutes."""
+        await get_redis().setex(self._password_cache_key(user.email, plain_password), 300, user.password[-16:])
+
+    def password_needs_rehash(self, hashed_password: str) -> bool:
+        """Check whether a password hash is legacy bcrypt or uses outdated argon2 parameters."""
+        if not hashed_password.startswith("$argon2"):
+            return True
+        return self.password_hasher.check_needs_rehash(hashed_password)
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """Create an access token."""
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.now(timezone.utc) + timedelta(seconds=expires_delta)
-        else:
-            expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-        to_encode.update(
-            {"iat": datetime.now(timezone.utc), "exp": expire, "scope": "access_token"})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = int(time.time())
+        expire = now + (int(expires_delta) if expires_delta else ACCESS_TOKEN_TTL)
+        to_encode = {**data, "iat": now, "exp": expire, "scope": "access_token"}
+        encoded_access_token = jwt.encode(to_encode, _SECRET, algorithm=_ALG)
         return encoded_access_token
 
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
         """Create a refresh token."""
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.now(timezone.utc) + timedelta(seconds=expires_delta)
-        else:
-            expire = datetime.now(timezone.utc) + timedelta(days=7)
-        to_encode.update(
-            {"iat": datetime.now(timezone.utc), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = int(time.time())
+        expire = now + (int(expires_delta) if expires_delta else REFRESH_TOKEN_TTL)
+        to_encode = {**data, "iat": now, "exp": expire, "scope": "refresh_token"}
+        encoded_refresh_token = jwt.encode(to_encode, _SECRET, algorithm=_ALG)
         return encoded_refresh_token
 
     async def decode_refresh_token(self, refresh_token: str):
         """Decode a refresh token."""
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = jwt.decode(refresh_token, _SECRET, algorithms=_ALGORITHMS, options=_DECODE_OPTIONS)
             if payload['scope'] == 'refresh_token':
                 email = payload['sub']
                 return email
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
-        except JWTError:
+        except PyJWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
     async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
@@ -91,60 +172,53 @@ class Auth:
         )
 
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError:
+            scope, email, expires_at = _decode_token_claims(token)
+        except PyJWTError:
+            raise credentials_exception
+        # Cached claims are only as good as the token: expiry is checked again on every hit
+        if scope != "access_token" or expires_at <= time.time():
             raise credentials_exception
 
-        user_hash = str(email)
-
-        user = self.cache.get(user_hash)
+        user = await self.get_cached_user(email)
         if user is None:
-            print("User from database")
+            logger.debug("User %s loaded from the database", email)
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.cache.set(user_hash, pickle.dumps(user))
-            self.cache.expire(user_hash, 300)
+            await self.cache_user(user)
         else:
-            print("User from cache")
-            user = pickle.loads(user)
-
-        # if user is None:
-        #     print("User from database")
-        #     user = await repository_users.get_user_by_email(email, db)
-        #     if user is None:
-        #         raise credentials_exception
-        #     await self.cache.set(user_hash, pickle.dumps(user))
-        #     await self.cache.expire(user_hash, 300)
-        # else:
-        #     print("User from cache")
-        #     user = pickle.loads(user)
+            logger.debug("User %s loaded from the cache", email)
         return user
 
     def create_email_token(self, data: dict):
         """Create a token for email verification."""
-        to_encode = data.copy()
-        expire = datetime.now(timezone.utc) + timedelta(days=1)
-        to_encode.update({"iat": datetime.now(timezone.utc), "exp": expire})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = int(time.time())
+        to_encode = {**data, "iat": now, "exp": now + EMAIL_TOKEN_TTL}
+        token = jwt.encode(to_encode, _SECRET, algorithm=_ALG)
         return token
 
     async def get_email_from_token(self, token: str):
         """Extract email from a token."""
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = jwt.decode(token, _SECRET, algorithms=_ALGORITHMS, options=_DECODE_OPTIONS)
             email = payload["sub"]
             return email
-        except JWTError as e:
-            print(e)
+        except PyJWTError as e:
+            logger.debug("Invalid email verification token: %s", e)
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
 
 
+@lru_cache(maxsize=10_000)
+def _decode_token_claims(token: str) -> tuple[Optional[str], str, int]:
+    """
+    Verify a token and return its scope, subject and expiry.
+
+    Clients send the same bearer token with many requests, so the signature check runs once per token
+    and process. Invalid tokens raise and are not cached.
+    """
+    payload = jwt.decode(token, _SECRET, algorithms=_ALGORITHMS, options=_DECODE_OPTIONS)
+    return payload.get("scope"), payload["sub"], payload["exp"]
+
+
 auth_service = Auth()
@@ -5,16 +5,22 @@ This module provides functionality for sending emails.
 
 Functions:
     - send_email: Sends an email for email verification.
+    - send_email_task: arq job that sends an email for email verification.
+
+Classes:
+    - WorkerSettings: Settings for the arq worker that consumes the email queue.
 """
 from pathlib import Path
 
+from arq.connections import RedisSettings
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
 from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
-from src.conf.config import config
+from src.conf.config import get_config
 
+config = get_config()
 conf = ConnectionConfig(
     MAIL_USERNAME=config.MAIL_USERNAME,
     MAIL_PASSWORD=config.MAIL_PASSWORD,
@@ -28,6 +34,11 @@ conf = ConnectionConfig(
     VALIDATE_CERTS=True,
     TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
 )
+arq_redis_settings = RedisSettings(
+    host=config.REDIS_DOMAIN,
+    port=config.REDIS_PORT,
+    password=config.REDIS_PASSWORD,
+)
 
 
 async def send_email(email: EmailStr, username: str, host: str):
@@ -55,3 +66,26 @@ async def send_email(email: EmailStr, username: str, host: str):
         await fm.send_message(message, template_name="verify_email.html")
     except ConnectionErrors as err:
         print(err)
+
+
+async def send_email_task(ctx: dict, email: str, username: str, host: str):
+    """
+    arq job that sends an email for email verification.
+
+    Args:
+        ctx (dict): The arq job context.
+        email (str): The email address of the recipient.
+        username (str): The username of the recipient.
+        host (str): The base URL of the application.
+    """
+    await send_email(email, username, host)
+
+
+class WorkerSettings:
+    """
+    Settings for the arq worker that consumes the email queue.
+
+    Run the worker with ``arq src.services.email.WorkerSettings``.
+    """
+    functions = [send_email_task]
+    redis_settings = arq_redis_settings
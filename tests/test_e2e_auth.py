@@ -1,21 +1,27 @@
 
-from unittest.mock import Mock, MagicMock
+from unittest.mock import ANY, AsyncMock, patch
 
+import msgpack
 import pytest
 from sqlalchemy import select
 
+from main import app
 from src.entity.models import User
 from tests.conftest import TestingSessionLocal
 from src.conf import messages
+from src.services.auth import auth_service
 
 user_data = {"username": "agent007", "email": "agent007@gmail.com", "password": "12345678"}
+# argon2id with the OWASP minimum profile configured in Auth.password_hasher
+ARGON2_PREFIX = "$argon2id$v=19$m=19456,t=2,p=1$"
 
 
 def test_signup(client, monkeypatch):
-    mock_send_email = Mock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    mock_arq = AsyncMock()
+    monkeypatch.setattr(app.state, "arq", mock_arq, raising=False)
     response = client.post("api/auth/signup", json=user_data)
     assert response.status_code == 201, response.text
+    mock_arq.enqueue_job.assert_awaited_once_with("send_email_task", user_data["email"], user_data["username"], ANY)
     data = response.json()
     assert data["username"] == user_data["username"]
     assert data["email"] == user_data["email"]
@@ -24,10 +30,11 @@ def test_signup(client, monkeypatch):
 
 
 def test_repeat_signup(client, monkeypatch):
-    mock_send_email = Mock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    mock_arq = AsyncMock()
+    monkeypatch.setattr(app.state, "arq", mock_arq, raising=False)
     response = client.post("api/auth/signup", json=user_data)
     assert response.status_code == 409, response.text
+    mock_arq.enqueue_job.assert_not_awaited()
     data = response.json()
     assert data["detail"] == messages.ACCOUNT_EXIST
 
@@ -41,27 +48,69 @@ def test_not_confirmed_login(client):
 
 
 @pytest.mark.asyncio
-async def test_login(client):
+async def test_login(client, monkeypatch):
     async with TestingSessionLocal() as session:
         current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
         current_user = current_user.scalar_one_or_none()
         if current_user:
+            assert current_user.password.startswith(ARGON2_PREFIX)
             current_user.confirmed = True
             await session.commit()
 
-    response = client.post("api/auth/login",
-                           data={"username": user_data.get("email"), "password": user_data.get("password")})
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        response = client.post("api/auth/login",
+                               data={"username": user_data.get("email"), "password": user_data.get("password")})
     assert response.status_code == 200, response.text
+    redis_mock.setex.assert_awaited_once()
     data = response.json()
     assert "access_token" in data
     assert "refresh_token" in data
     assert "token_type" in data
 
 
+@pytest.mark.asyncio
+async def test_login_rehashes_bcrypt_password(client, monkeypatch):
+    async with TestingSessionLocal() as session:
+        current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
+        current_user = current_user.scalar_one()
+        current_user.password = auth_service.pwd_context.hash(user_data.get("password"))
+        await session.commit()
+
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        response = client.post("api/auth/login",
+                               data={"username": user_data.get("email"), "password": user_data.get("password")})
+    assert response.status_code == 200, response.text
+
+    async with TestingSessionLocal() as session:
+        current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
+        assert current_user.scalar_one().password.startswith(ARGON2_PREFIX)
+
+
+@pytest.mark.asyncio
+async def test_login_with_cached_password(client, monkeypatch):
+    async with TestingSessionLocal() as session:
+        current_user = await session.execute(select(User).where(User.email == user_data.get("email")))
+        password_hash = current_user.scalar_one().password
+
+    verify_mock = AsyncMock()
+    monkeypatch.setattr(auth_service, "verify_password", verify_mock)
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = password_hash[-16:].encode()
+        response = client.post("api/auth/login",
+                               data={"username": user_data.get("email"), "password": user_data.get("password")})
+    assert response.status_code == 200, response.text
+    verify_mock.assert_not_awaited()
+
+
 def test_wrong_password_login(client):
-    response = client.post("api/auth/login",
-                           data={"username": user_data.get("email"), "password": "password"})
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        response = client.post("api/auth/login",
+                               data={"username": user_data.get("email"), "password": "password"})
     assert response.status_code == 401, response.text
+    redis_mock.setex.assert_not_called()
     data = response.json()
     assert data["detail"] == messages.INVALID_PASSWORD
 
@@ -80,3 +129,23 @@ def test_validation_error_login(client):
     assert response.status_code == 422, response.text
     data = response.json()
     assert "detail" in data
+
+
+@pytest.mark.parametrize("email, cached", [
+    ("nobody@example.com", None),
+    (user_data["email"], None),
+    (user_data["email"], {"id": 1, "username": user_data["username"], "email": user_data["email"],
+                          "avatar": None, "confirmed": True}),
+])
+def test_request_email(client, monkeypatch, email, cached):
+    mock_arq = AsyncMock()
+    monkeypatch.setattr(app.state, "arq", mock_arq, raising=False)
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = msgpack.packb(cached) if cached else None
+        response = client.post("api/auth/request_email", json={"email": email})
+    assert response.status_code == 200, response.text
+    assert response.json()["message"] == "Check your email for confirmation."
+    mock_arq.enqueue_job.assert_not_awaited()
@@ -1,12 +1,14 @@
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
 
+import msgpack
 import pytest
 
-from src.services.auth import auth_service
+from src.database.db import USER_CACHE_TTL, user_cache_key
+from tests.conftest import test_user
 
 
 def test_get_me(client, get_token, monkeypatch):
-    with patch.object(auth_service, 'cache') as redis_mock:
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
         redis_mock.get.return_value = None
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
         monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
@@ -15,3 +17,83 @@ def test_get_me(client, get_token, monkeypatch):
         headers = {"Authorization": f"Bearer {token}"}
         response = client.get("api/users/me", headers=headers)
         assert response.status_code == 200, response.text
+        # A cache miss stores the user with its TTL in a single command
+        redis_mock.setex.assert_awaited_once()
+        assert redis_mock.setex.call_args.args[:2] == (user_cache_key(test_user["email"]), USER_CACHE_TTL)
+        redis_mock.set.assert_not_called()
+        redis_mock.expire.assert_not_called()
+
+
+def test_get_me_from_cache(client, get_token, monkeypatch):
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = msgpack.packb({"id": 1, "username": test_user["username"],
+                                                    "email": test_user["email"], "avatar": None,
+                                                    "confirmed": True})
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        token = get_token
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("api/users/me", headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["email"] == test_user["email"]
+        redis_mock.setex.assert_not_called()
+
+
+def test_get_me_with_expired_token(client, get_token, monkeypatch):
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        token = get_token
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("api/users/me", headers=headers)
+        assert response.status_code == 200, response.text
+        # The decoded token is cached now, but its expiry still applies
+        monkeypatch.setattr("src.services.auth.time.time", lambda: 10 ** 10)
+        response = client.get("api/users/me", headers=headers)
+        assert response.status_code == 401, response.text
+
+
+def test_update_avatar(client, get_token, monkeypatch):
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        redis_mock.get.return_value = None
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        upload_mock = MagicMock(return_value={"version": 1})
+        monkeypatch.setattr("cloudinary.uploader.upload", upload_mock)
+        token = get_token
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.patch("api/users/avatar", headers=headers, files={"file": ("avatar.png", b"png")})
+        assert response.status_code == 200, response.text
+        upload_mock.assert_called_once()
+        assert response.json()["avatar"].startswith("https://res.cloudinary.com/")
+
+
+@pytest.mark.parametrize("authorization", [None, "Basic abc"])
+def test_get_me_without_bearer_token(client, monkeypatch, authorization):
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+    monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+    headers = {"Authorization": authorization} if authorization else {}
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Not authenticated"
+
+
+def test_get_me_ignores_colliding_cache_entry(client, get_token, monkeypatch):
+    with patch("src.database.db._redis_client", new_callable=AsyncMock) as redis_mock:
+        # An entry under the same key digest that belongs to another user
+        redis_mock.get.return_value = msgpack.packb({"id": 2, "username": "other", "email": "other@example.com",
+                                                    "avatar": None, "confirmed": True})
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.redis", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.identifier", AsyncMock())
+        monkeypatch.setattr("fastapi_limiter.FastAPILimiter.http_callback", AsyncMock())
+        token = get_token
+        headers = {"Authorization": f"Bearer {token}"}
+        response = client.get("api/users/me", headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["email"] == test_user["email"]
+        redis_mock.setex.assert_awaited_once()
@@ -1,9 +1,7 @@
-# from your_module import get_upcoming_birthdays, Contact, ContactResponse, User  # замените your_module на имя вашего модуля
-# from unittest.mock import AsyncMock, patch, MagicMock
 import unittest
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, timedelta
+from datetime import date, timedelta
 from src.repository.contacts import (
     get_contacts,
     get_contact,
@@ -15,19 +13,31 @@ from src.repository.contacts import (
 from src.entity.models import User, Contact
 from src.schemas.contact import ContactSchema, ContactUpdateSchema
 
+_TODAY = date(2024, 6, 16)
+# Birthday in 3 days
+_UPCOMING_CONTACT = Contact(
+    id=1, first_name="John", last_name="Doe", email="john@example.com", phone_number="1234567890",
+    birthday=_TODAY + timedelta(days=3), additional_data="", created_at=_TODAY, updated_at=_TODAY, user=None
+)
+
 
 class TestContactRepository(unittest.IsolatedAsyncioTestCase):
 
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls._session = AsyncMock(spec=AsyncSession)
+
     def setUp(self) -> None:
         self.user = User(id=1, username="test", password="test", email="test@test.com")
-        self.session = AsyncMock(spec=AsyncSession)
+        self._session.reset_mock(return_value=True, side_effect=True)
+        self.session = self._session
         self.contact = Contact(id=1, user_id=self.user.id, first_name="Test", last_name="Contact",
                                email="test@example.com")
 
     async def test_get_contacts(self):
         # Test parameters
         limit = 10
-        offset = 0
+        cursor = None
         # Mocking the database query result
         contacts = [Contact(id=1, first_name="Test", last_name="Test", email="test@example.com", user_id=1),
                     Contact(id=2, first_name="Test_2", last_name="Test_2", email="test_2@example.com", user_id=1)]
@@ -35,14 +45,35 @@ class TestContactRepository(unittest.IsolatedAsyncioTestCase):
         mock_contacts.scalars.return_value.all.return_value = contacts
         self.session.execute.return_value = mock_contacts
         # Calling the function under test
-        result = await get_contacts(limit, offset, self.user, self.session)
+        result = await get_contacts(limit, cursor, self.user, self.session)
         # Verifying the result
         self.assertEqual(result, contacts)
 
+    async def test_get_contact(self):
+        # Mocking the primary key lookup
+        self.session.get.return_value = self.contact
+        # Calling the function under test
+        result = await get_contact(self.contact.id, self.user, self.session)
+        # Verifying the result
+        self.assertEqual(result, self.contact)
+
+    async def test_get_contact_of_another_user(self):
+        # Mocking the primary key lookup returning a contact owned by someone else
+        self.session.get.return_value = Contact(id=2, user_id=2, first_name="Other", last_name="Contact",
+                                                email="other@example.com")
+        # Calling the function under test
+        result = await get_contact(2, self.user, self.session)
+        # Verifying that the contact is not returned
+        self.assertIsNone(result)
+
     async def test_create_contact(self):
         # Test parameters
         body = ContactSchema(first_name="John", last_name="Doe", email="john@example.com", phone_number="1234567890",
                              birthday="1990-01-01")
+        # Mocking the row returned by INSERT ... RETURNING
+        mock_contact = MagicMock()
+        mock_contact.scalar_one.return_value = Contact(**body.model_dump(), user_id=self.user.id)
+        self.session.execute.return_value = mock_contact
         # Calling the function under test
         result = await create_contact(body, self.user, self.session)
         # Verifying that the contact is created
@@ -50,8 +81,8 @@ class TestContactRepository(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.first_name, body.first_name)
         self.assertEqual(result.last_name, body.last_name)
         self.assertEqual(result.email, body.email)
-        # self.assertEqual(result.phone_number, body.phone_number)
-        # self.assertEqual(result.birthday, body.birthday)
+        self.assertEqual(result.phone_number, body.phone_number)
+        self.assertEqual(result.birthday, body.birthday)
 
     async def test_update_contact(self):
         # Test parameters
@@ -69,41 +100,33 @@ class TestContactRepository(unittest.IsolatedAsyncioTestCase):
 
     async def test_delete_contact(self):
         # Mocking the database query result
-        mock_contact = MagicMock()
-        mock_contact.scalar_one_or_none.return_value = self.contact
-        self.session.execute.return_value = mock_contact
+        mock_result = MagicMock()
+        mock_result.scalar_one_or_none.return_value = self.contact.id
+        self.session.execute.return_value = mock_result
         # Calling the function under test
         result = await delete_contact(self.contact.id, self.user, self.session)
-        # Verifying that the contact is deleted
-        self.assertEqual(result, self.contact)
+        # Verifying that the ID of the deleted contact is returned
+        self.assertEqual(result, self.contact.id)
 
     async def test_get_upcoming_birthdays(self):
-        # Создаем фиктивные данные
-        fake_today = datetime(2024, 6, 16).date()
-        fake_birthday_1 = fake_today + timedelta(days=3)  # День рождения через 3 дня
-        # День рождения через 10 дней
-        fake_birthday_2 = fake_today + timedelta(days=10)
-
-        contact_1 = Contact(
-            id=1, first_name="John", last_name="Doe", email="john@example.com", phone_number="1234567890",
-            birthday=fake_birthday_1, additional_data="", created_at=fake_today, updated_at=fake_today, user=None
-        )
-        contact_2 = Contact(
-            id=2, first_name="Jane", last_name="Doe", email="jane@example.com", phone_number="0987654321",
-            birthday=fake_birthday_2, additional_data="", created_at=fake_today, updated_at=fake_today, user=None
-        )
-
-        self.session.execute.return_value = [
-            contact_1, contact_2]
-
-        result = await get_upcoming_birthdays(self.user, self.session)
-
-        # Проверка результатов
-        self.assertEqual(len(result), 1)
-        self.assertEqual(result[0].first_name, "John")
-        self.assertEqual(result[0].last_name, "Doe")
-        self.assertEqual(result[0].email, "john@example.com")
+        # The 7-day window is applied in SQL, so the database only returns the contact inside it
+        for today, window_sql in ((_TODAY, "BETWEEN"), (date(2024, 12, 28), " OR ")):
+            with self.subTest(today=today), patch("src.repository.contacts.date") as date_mock:
+                date_mock.today.return_value = today
+                self.session.stream_scalars.reset_mock()
+                mock_result = MagicMock()
+                mock_result.__aiter__.return_value = [_UPCOMING_CONTACT]
+                self.session.stream_scalars.return_value = mock_result
+
+                result = await get_upcoming_birthdays(self.user, self.session)
 
+                # A window wrapping past December 31 is split into two ranges
+                stmt = self.session.stream_scalars.await_args.args[0]
+                self.assertIn(window_sql, str(stmt))
+                self.assertEqual(len(result), 1)
+                self.assertEqual(result[0].first_name, "John")
+                self.assertEqual(result[0].last_name, "Doe")
+                self.assertEqual(result[0].email, "john@example.com")
 
 # Запуск тестов
 
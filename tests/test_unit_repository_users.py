@@ -1,83 +1,199 @@
 import pytest
+from redis.exceptions import LockNotOwnedError
 from unittest.mock import AsyncMock, MagicMock
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.repository.users import (
     get_user_by_email,
     create_user,
     update_token,
+    get_refresh_token,
+    flush_pending_tokens,
+    update_password,
     confirmed_email,
     update_avatar_url,
+    gravatar_url,
 )
+from src.database.db import user_cache_key
 from src.entity.models import User
 from src.schemas.user import UserSchema
 
 
+# Building a mock from the AsyncSession spec is slow, so one is shared and reset before each test
+_session = MagicMock(spec=AsyncSession)
+
+
+@pytest.fixture
+def session():
+    _session.reset_mock(return_value=True, side_effect=True)
+    return _session
+
+
+@pytest.fixture
+def session_returning(session):
+    """Factory configuring the shared session so that every way of reading a result yields ``obj``."""
+    def _returning(obj):
+        result = MagicMock()
+        result.scalars.return_value.first.return_value = obj
+        result.scalar_one.return_value = obj
+        result.scalar_one_or_none.return_value = obj
+        session.execute.return_value = result
+        return session
+    return _returning
+
+
+@pytest.fixture(autouse=True)
+def redis_mock(monkeypatch):
+    redis_mock = AsyncMock()
+    # pipeline() and lock() are synchronous factories on the asyncio client
+    redis_mock.pipeline = MagicMock()
+    redis_mock.pipeline.return_value.execute = AsyncMock()
+    redis_mock.lock = MagicMock()
+    redis_mock.lock.return_value = AsyncMock()
+    monkeypatch.setattr("src.database.db._redis_client", redis_mock)
+    return redis_mock
+
+
 @pytest.mark.asyncio
 class TestUserRepository:
 
-    async def test_get_user_by_email(self):
-        # Mocking the database session
-        session = MagicMock(spec=AsyncSession)
+    async def test_get_user_by_email(self, session_returning):
         # Test parameters
         email = "test@example.com"
         # Mocking the database query result
         user = User(email=email)
-        session.execute = AsyncMock(
-            return_value=MagicMock(scalars=MagicMock(return_value=MagicMock(first=MagicMock(return_value=user)))))
+        session = session_returning(user)
         # Calling the function under test
         result = await get_user_by_email(email, session)
         # Verifying the result
         assert result == user
 
-    async def test_create_user(self):
-        # Mocking the database session
-        session = MagicMock(spec=AsyncSession)
+    async def test_create_user(self, session_returning):
         # Test parameters
         body = UserSchema(email="test@example.com", password="password", username="testuser")
+        # Mocking the row returned by INSERT ... RETURNING
+        session = session_returning(User(**body.model_dump()))
         # Calling the function under test
         result = await create_user(body, session)
+        stmt = session.execute.await_args.args[0]
+        assert stmt.compile().params["avatar"].startswith("https://www.gravatar.com/avatar/")
         # Verifying that the user is created
         assert isinstance(result, User)
         assert result.email == body.email
         assert result.password == body.password
         assert result.username == body.username
 
-    async def test_update_token(self):
-        # Mocking the database session
-        session = MagicMock(spec=AsyncSession)
+    async def test_create_existing_user(self, session_returning):
         # Test parameters
-        user = User(email="test@example.com")
+        body = UserSchema(email="test@example.com", password="password", username="testuser")
+        # ON CONFLICT DO NOTHING returns no row for a duplicate user
+        session = session_returning(None)
+        # Calling the function under test
+        result = await create_user(body, session)
+        # Verifying that nothing is created
+        assert result is None
+
+    async def test_update_token(self, session, redis_mock):
+        # Test parameters
+        user = User(id=1, email="test@example.com")
         token = "new_token"
         # Calling the function under test
         await update_token(user, token, session)
-        # Verifying that the user's token is updated
+        # Verifying that the token is queued in Redis instead of being committed
         assert user.refresh_token == token
+        redis_mock.hset.assert_awaited_once_with("pending_tokens", 1, token)
+        session.commit.assert_not_called()
+
+    async def test_get_refresh_token(self, session, redis_mock):
+        # Test parameters
+        user = User(id=1, email="test@example.com", refresh_token="stored_token")
+        # A queued token takes precedence over the stored one, "" marks a revoked token
+        redis_mock.pipeline.return_value.execute.return_value = [b"queued_token", None]
+        assert await get_refresh_token(user, session) == "queued_token"
+        redis_mock.pipeline.return_value.execute.return_value = [None, b""]
+        assert await get_refresh_token(user, session) is None
+        session.scalar.assert_not_called()
 
-    async def test_confirmed_email(self):
-        # Mocking the database session
-        session = MagicMock(spec=AsyncSession)
+    async def test_get_refresh_token_after_concurrent_flush(self, session, redis_mock):
+        # The user was loaded before another worker flushed and unqueued a newer token
+        user = User(id=1, email="test@example.com", refresh_token="old_token")
+        redis_mock.pipeline.return_value.execute.return_value = [None, None]
+        session.scalar.return_value = "flushed_token"
+        # Calling the function under test
+        assert await get_refresh_token(user, session) == "flushed_token"
+        stmt = session.scalar.await_args.args[0]
+        assert stmt.compile().params == {"id_1": 1}
+
+    async def test_flush_pending_tokens(self, session, redis_mock):
+        # Mocking the queued tokens
+        redis_mock.lock.return_value.acquire.return_value = True
+        redis_mock.lock.return_value.owned.return_value = True
+        redis_mock.exists.side_effect = [False, True]
+        redis_mock.hgetall.return_value = {b"1": b"token", b"2": b""}
+        # Calling the function under test
+        result = await flush_pending_tokens(session)
+        # Verifying that all tokens are written in one batch and the queue is dropped afterwards
+        assert result == 2
+        redis_mock.rename.assert_awaited_once_with("pending_tokens", "pending_tokens:flushing")
+        assert session.execute.await_args.args[1] == [{"id": 1, "refresh_token": "token"},
+                                                      {"id": 2, "refresh_token": None}]
+        redis_mock.lock.return_value.reacquire.assert_awaited_once()
+        session.commit.assert_awaited_once()
+        redis_mock.delete.assert_awaited_once_with("pending_tokens:flushing")
+        redis_mock.lock.return_value.release.assert_awaited_once()
+
+    async def test_flush_pending_tokens_after_losing_the_lock(self, session, redis_mock):
+        # Mocking a lock that expires while the UPDATE runs
+        redis_mock.lock.return_value.acquire.return_value = True
+        redis_mock.lock.return_value.owned.return_value = False
+        redis_mock.lock.return_value.release.side_effect = LockNotOwnedError("expired")
+        redis_mock.exists.side_effect = [True]
+        redis_mock.hgetall.return_value = {b"1": b"token"}
+        # Calling the function under test
+        result = await flush_pending_tokens(session)
+        # Verifying that the stale batch is neither committed nor dropped from Redis
+        assert result == 0
+        session.rollback.assert_awaited_once()
+        session.commit.assert_not_awaited()
+        redis_mock.delete.assert_not_awaited()
+
+    async def test_update_password(self, session, redis_mock):
+        # Test parameters
+        user = User(email="test@example.com")
+        password = "new_hash"
+        # Calling the function under test
+        await update_password(user, password, session)
+        # Verifying that the user's password hash is updated and the cached user is evicted
+        assert user.password == password
+        session.commit.assert_awaited_once()
+        redis_mock.delete.assert_awaited_once_with(user_cache_key("test@example.com"))
+
+    async def test_confirmed_email(self, session):
         # Test parameters
         email = "test@example.com"
-        # Mocking the database query result
-        user = User(email=email)
-        session.execute = AsyncMock(
-            return_value=MagicMock(scalars=MagicMock(return_value=MagicMock(first=MagicMock(return_value=user)))))
         # Calling the function under test
         await confirmed_email(email, session)
-        # Verifying that the user's email is confirmed
-        assert user.confirmed
+        # Verifying that a single UPDATE confirms the email
+        stmt = session.execute.await_args.args[0]
+        assert stmt.compile().params == {"confirmed": True, "email_1": email}
+        session.commit.assert_awaited_once()
 
-    async def test_update_avatar_url(self):
-        # Mocking the database session
-        session = MagicMock(spec=AsyncSession)
+    async def test_update_avatar_url(self, session_returning):
         # Test parameters
         email = "test@example.com"
         url = "http://example.com/avatar.jpg"
-        # Mocking the database query result
-        user = User(email=email)
-        session.execute = AsyncMock(
-            return_value=MagicMock(scalars=MagicMock(return_value=MagicMock(first=MagicMock(return_value=user)))))
+        # Mocking the row returned by UPDATE ... RETURNING
+        user = User(email=email, avatar=url)
+        session = session_returning(user)
         # Calling the function under test
         result = await update_avatar_url(email, url, session)
         # Verifying that the user's avatar URL is updated
+        stmt = session.execute.await_args.args[0]
+        assert stmt.compile().params == {"avatar": url, "email_1": email}
         assert result.avatar == url
+
+
+def test_gravatar_url_normalizes_email():
+    # Gravatar hashes the trimmed, lower-cased address
+    url = gravatar_url(" Test@Example.com ")
+    assert url == gravatar_url("test@example.com")
+    assert url == "https://www.gravatar.com/avatar/55502f40dc8b7c769880b10874abc9d0?d=identicon"